@@ -3,67 +3,95 @@
 Analyze trainer feedback CSV to identify top improving trainers.
 """
 
-import pandas as pd
-import numpy as np
-import json
+import re
+import textwrap
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+from jinja2 import Environment
 
-def clean_numeric(val):
-    """Convert value to float, handling nan and non-numeric values."""
-    try:
-        if pd.isna(val) or val == '' or val == 'nan':
-            return np.nan
-        return float(val)
-    except (ValueError, TypeError):
-        return np.nan
-
-
-def extract_positive_quotes(df, text_cols):
-    """Extract positive quotes from text columns."""
-    quotes = []
-
-    for col in text_cols:
-        if col in df.columns:
-            for idx, row in df.iterrows():
-                text = row[col]
-                row_id = row['row_id']
-
-                # Skip empty/nan values
-                if pd.isna(text) or text == '' or text == 'nan' or text == '-':
-                    continue
-
-                # Skip short responses
-                text_str = str(text).strip()
-                if len(text_str) < 20:
-                    continue
-
-                # Look for positive indicators
-                positive_keywords = ['excellent', 'great', 'love', 'helpful', 'enjoyed',
-                                   'beneficial', 'best', 'appreciated', 'wonderful',
-                                   'positive', 'fun', 'engaging', 'motivated', 'patient',
-                                   'clear', 'friendly', 'approachable', 'flexible']
-
-                text_lower = text_str.lower()
-                has_positive = any(keyword in text_lower for keyword in positive_keywords)
 
-                if has_positive:
-                    # Limit quote length for readability
-                    if len(text_str) > 200:
-                        text_str = text_str[:200] + "..."
+# Look for positive indicators
+POSITIVE_KEYWORDS = ('excellent', 'great', 'love', 'helpful', 'enjoyed',
+                     'beneficial', 'best', 'appreciated', 'wonderful',
+                     'positive', 'fun', 'engaging', 'motivated', 'patient',
+                     'clear', 'friendly', 'approachable', 'flexible')
+_POS_RE = re.compile('|'.join(map(re.escape, POSITIVE_KEYWORDS)), re.IGNORECASE)
 
-                    quotes.append({
-                        'row_id': row_id,
-                        'quote': text_str,
-                        'source_column': col
-                    })
+# Rows per chunk when streaming the feedback CSV
+CHUNK_SIZE = 100_000
 
-    return quotes
 
+def extract_positive_quotes(df, text_cols, limit=None):
+    """Extract positive quotes from text columns, grouped by trainer and longest first."""
+    candidates = []
 
-def generate_html_report(results):
-    """Generate an HTML report from the results."""
-    html = """<!DOCTYPE html>
+    for col in text_cols:
+        if col in df.columns:
+            # Skip empty/nan values
+            sub = df.loc[df[col].notna(), ['Trainer', 'row_id', col]]
+            text_str = sub[col].astype(str).str.strip()
+
+            # Skip short responses
+            text_len = text_str.str.len()
+            long_enough = text_len >= 20
+            text_str = text_str[long_enough]
+            text_len = text_len[long_enough]
+
+            # Keep those with positive indicators
+            positive = text_str.str.contains(_POS_RE, na=False)
+            text_str = text_str[positive]
+            text_len = text_len[positive]
+            sub = sub.loc[text_str.index]
+
+            # Limit quote length for readability
+            truncated = text_str.mask(text_len > 200, text_str.str.slice(0, 200) + "...")
+
+            candidates.append(pd.DataFrame({
+                'Trainer': sub['Trainer'],
+                'row_id': sub['row_id'],
+                'quote': truncated,
+                'source_column': col,
+                'quote_len': text_len.where(text_len <= 200, 203)
+            }))
+
+    if not candidates:
+        return {}
+
+    # Prefer longer, more detailed quotes and keep only as many as needed
+    quotes = pd.concat(candidates, ignore_index=True)
+    quotes = quotes.sort_values('quote_len', ascending=False, kind='stable')
+    if limit is not None:
+        quotes = quotes.groupby('Trainer', sort=False).head(limit)
+
+    return {
+        trainer: [
+            {
+                'row_id': row_id,
+                'quote': quote,
+                'source_column': source
+            } for row_id, quote, source in zip(group['row_id'], group['quote'], group['source_column'])
+        ] for trainer, group in quotes.groupby('Trainer', sort=False)
+    }
+
+
+def read_feedback_chunks(csv_path, columns):
+    """Read the given CSV columns in chunks, tagging each row with its stable row_id."""
+    # Arrow-backed strings give vectorized .str kernels and compact storage
+    reader = pd.read_csv(csv_path, usecols=columns, dtype=pd.ArrowDtype(pa.string()),
+                         engine='c', chunksize=CHUNK_SIZE)
+
+    for chunk in reader:
+        # Chunks share one running index, so row_id stays stable across them
+        chunk['row_id'] = 'R' + pd.Series(chunk.index + 1, index=chunk.index).astype(str).str.zfill(4)
+        yield chunk
+
+
+HTML_SOURCE = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -325,66 +353,55 @@ def generate_html_report(results):
     </div>
 
     <div class="container">
-"""
-
-    for result in results:
-        rank_class = f"rank-{result['rank']}"
-        improvement_sign = "+" if result['improvement_score'] >= 0 else ""
+        {% for result in results %}
 
-        html += f"""
         <div class="trainer-card">
             <div class="card-header">
-                <div class="rank-badge {rank_class}">#{result['rank']}</div>
-                <div class="trainer-name">{result['trainer_name']}</div>
+                <div class="rank-badge rank-{{ result.rank }}">#{{ result.rank }}</div>
+                <div class="trainer-name">{{ result.trainer_name }}</div>
             </div>
 
             <div class="card-body">
                 <div class="metrics-grid">
                     <div class="metric">
                         <div class="metric-label">Responses</div>
-                        <div class="metric-value">{result['n_responses']}</div>
+                        <div class="metric-value">{{ result.n_responses }}</div>
                     </div>
                     <div class="metric">
                         <div class="metric-label">Early Score</div>
-                        <div class="metric-value">{result['mean_early_score']:.2f}</div>
+                        <div class="metric-value">{{ '%.2f'|format(result.mean_early_score) }}</div>
                     </div>
                     <div class="metric">
                         <div class="metric-label">Late Score</div>
-                        <div class="metric-value">{result['mean_late_score']:.2f}</div>
+                        <div class="metric-value">{{ '%.2f'|format(result.mean_late_score) }}</div>
                     </div>
                     <div class="metric">
                         <div class="metric-label">Improvement</div>
-                        <div class="metric-value improvement-positive">{improvement_sign}{result['improvement_score']:.3f}</div>
+                        <div class="metric-value improvement-positive">{{ '%+.3f'|format(result.improvement_score) }}</div>
                     </div>
                 </div>
 
                 <div class="case-study">
                     <div class="case-study-label">Case Study Angle</div>
-                    <div class="case-study-text">{result['case_study_angle']}</div>
+                    <div class="case-study-text">{{ result.case_study_angle }}</div>
                 </div>
 
                 <div class="section-title">Positive Feedback</div>
-"""
+                {% for quote in result.quotes %}
 
-        for i, quote in enumerate(result['quotes'], 1):
-            source_clean = quote['source'].split('_', 1)[1] if '_' in quote['source'] else quote['source']
-            source_clean = source_clean.replace('*', '').strip()
-            html += f"""
                 <div class="quote">
-                    <div class="quote-text">{quote['quote']}</div>
+                    <div class="quote-text">{{ quote.quote }}</div>
                     <div class="quote-meta">
-                        <span class="row-id">{quote['row_id']}</span>
-                        <span class="source-label">{source_clean}</span>
+                        <span class="row-id">{{ quote.row_id }}</span>
+                        <span class="source-label">{{ quote.source|source_label }}</span>
                     </div>
                 </div>
-"""
+                {% endfor %}
 
-        html += """
             </div>
         </div>
-"""
+        {% endfor %}
 
-    html += """
     </div>
 
     <footer>
@@ -394,7 +411,23 @@ def generate_html_report(results):
 </body>
 </html>
 """
-    return html
+
+
+@lru_cache(maxsize=None)
+def source_label(source):
+    """Turn a feedback column name into a readable label (cached per column)."""
+    label = source.split('_', 1)[1] if '_' in source else source
+    return label.replace('*', '').strip()
+
+
+_ENV = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True)
+_ENV.filters['source_label'] = source_label
+_TEMPLATE = _ENV.from_string(HTML_SOURCE)
+
+
+def generate_html_report(results):
+    """Generate an HTML report from the results."""
+    return _TEMPLATE.render(results=results)
 
 
 def main():
@@ -402,108 +435,108 @@ def main():
     csv_path = Path('data/export_Learner-Feedback-for-Trainers_2026-01-30_15-55-17_anonymised.csv')
     print(f"Loading CSV: {csv_path}")
 
-    df = pd.read_csv(csv_path)
-    print(f"Loaded {len(df)} records")
-
-    # Assign stable row_id
-    df['row_id'] = [f"R{i:04d}" for i in range(1, len(df) + 1)]
-
-    # Parse Creation Date
-    df['creation_datetime'] = pd.to_datetime(df['Creation Date'], format='%b %d, %Y %I:%M %p', errors='coerce')
-
     # Define numeric score columns
     score_cols = ['1.3', '1.4', '2.8', '2.9', 'v1_1.2', 'v2_1.1', 'v2_1.2']
 
-    # Get actual column names (they have full text descriptions)
-    actual_score_cols = []
-    for score_col in score_cols:
-        matching_cols = [col for col in df.columns if col.startswith(score_col)]
-        if matching_cols:
-            actual_score_cols.append(matching_cols[0])
+    header = pd.read_csv(csv_path, nrows=0).columns
 
-    print(f"\nScore columns found: {actual_score_cols}")
+    # Get actual column names (they have full text descriptions)
+    col_by_prefix = {}
+    for col in header:
+        for score_col in score_cols:
+            if col.startswith(score_col):
+                col_by_prefix.setdefault(score_col, col)
+                break
+    actual_score_cols = [col_by_prefix[score_col] for score_col in score_cols if score_col in col_by_prefix]
 
-    # Clean and convert score columns to numeric
-    for col in actual_score_cols:
-        df[col] = df[col].apply(clean_numeric)
+    # First pass: keep only what the improvement stats need from each chunk
+    n_records = 0
+    score_chunks = []
 
-    # Compute composite score (average of available scores per row)
-    df['composite_score'] = df[actual_score_cols].mean(axis=1, skipna=True)
+    for chunk in read_feedback_chunks(csv_path, ['Trainer', 'Creation Date'] + actual_score_cols):
+        n_records += len(chunk)
 
-    # Filter out rows with no trainer or no valid creation date
-    df = df[df['Trainer'].notna() & df['creation_datetime'].notna()].copy()
+        # Parse Creation Date
+        chunk['creation_datetime'] = pd.to_datetime(chunk['Creation Date'], format='%b %d, %Y %I:%M %p', errors='coerce')
 
-    print(f"\nRecords with valid trainer and date: {len(df)}")
+        # Clean and convert score columns to numeric, then cast to float64:
+        # pd.to_numeric leaves the string dtype untouched on an empty chunk, and
+        # coerced non-numeric strings (free-text answers) become Arrow NaN values
+        # that are not nulls, so skipna would not skip them in the row-wise mean;
+        # float64 turns them into ordinary NaN
+        chunk[actual_score_cols] = chunk[actual_score_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
 
-    # Group by trainer
-    trainer_stats = []
+        # Compute composite score (average of available scores per row)
+        chunk['composite_score'] = chunk[actual_score_cols].mean(axis=1, skipna=True)
 
-    for trainer, group in df.groupby('Trainer'):
-        n_responses = len(group)
+        # Filter out rows with no trainer or no valid creation date
+        chunk.dropna(subset=['Trainer', 'creation_datetime'], inplace=True)
 
-        # Only process trainers with >= 3 responses
-        if n_responses < 3:
-            continue
+        score_chunks.append(chunk[['row_id', 'Trainer', 'creation_datetime', 'composite_score']])
 
-        # Sort by date
-        group = group.sort_values('creation_datetime')
+    df = pd.concat(score_chunks, ignore_index=True)
 
-        # Split into early and late halves
-        mid_point = len(group) // 2
-        early_half = group.iloc[:mid_point]
-        late_half = group.iloc[mid_point:]
+    print(f"Loaded {n_records} records")
+    print(f"\nScore columns found: {actual_score_cols}")
+    print(f"\nRecords with valid trainer and date: {len(df)}")
 
-        # Calculate mean scores for each half
-        early_scores = early_half['composite_score'].dropna()
-        late_scores = late_half['composite_score'].dropna()
+    # Sort once by trainer, then by date; both the stats and the quotes reuse this order
+    df = df.sort_values(['Trainer', 'creation_datetime'], kind='mergesort').reset_index(drop=True)
 
-        if len(early_scores) > 0 and len(late_scores) > 0:
-            mean_early = early_scores.mean()
-            mean_late = late_scores.mean()
-            improvement = mean_late - mean_early
+    # Split each trainer's feedback into early and late halves
+    position = df.groupby('Trainer').cumcount()
+    n_responses = df.groupby('Trainer')['Trainer'].transform('size')
+    df['half'] = np.where(position < n_responses // 2, 'early', 'late')
 
-            trainer_stats.append({
-                'trainer': trainer,
-                'n_responses': n_responses,
-                'mean_early': mean_early,
-                'mean_late': mean_late,
-                'improvement': improvement,
-                'group_df': group
-            })
+    # Only process trainers with >= 3 responses
+    eligible = df[n_responses >= 3]
 
-    # Sort by improvement (descending)
-    trainer_stats.sort(key=lambda x: x['improvement'], reverse=True)
+    # Calculate mean scores for each half
+    trainer_stats = (
+        eligible.groupby(['Trainer', 'half'])['composite_score']
+        .mean()
+        .unstack()
+        .reindex(columns=['early', 'late'])
+    )
+    trainer_stats['improvement'] = trainer_stats['late'] - trainer_stats['early']
+    trainer_stats['n_responses'] = eligible.groupby('Trainer').size()
+    trainer_stats = trainer_stats.dropna(subset=['improvement'])
 
     print(f"\nTrainers with >= 3 responses: {len(trainer_stats)}")
 
-    # Select top 2
-    top_2 = trainer_stats[:2]
+    # Select top 2 by improvement
+    top_2 = trainer_stats.nlargest(2, 'improvement')
 
     # Text columns for quotes
-    text_cols = [col for col in df.columns if '3.12' in col or '3.13' in col]
+    text_cols = [col for col in header if '3.12' in col or '3.13' in col]
 
     print(f"\nText columns for quotes: {text_cols}")
 
+    # Second pass: collect the text columns for the top trainers' rows only
+    top_rows = df[df['Trainer'].isin(top_2.index)]
+    if text_cols:
+        text_chunks = [
+            chunk.loc[chunk['row_id'].isin(top_rows['row_id']), ['row_id'] + text_cols]
+            for chunk in read_feedback_chunks(csv_path, text_cols)
+        ]
+        top_rows = top_rows.merge(pd.concat(text_chunks), on='row_id', how='left')
+
+    # Extract the best 2 positive quotes per top trainer
+    quotes_by_trainer = extract_positive_quotes(top_rows, text_cols, limit=2)
+
     # Build results
     results = []
 
-    for idx, trainer_data in enumerate(top_2, 1):
-        trainer = trainer_data['trainer']
-        n_responses = trainer_data['n_responses']
+    for idx, (trainer, trainer_data) in enumerate(top_2.iterrows(), 1):
+        n_responses = int(trainer_data['n_responses'])
         improvement = trainer_data['improvement']
-        group_df = trainer_data['group_df']
 
         print(f"\n{'='*60}")
         print(f"Top {idx}: {trainer}")
         print(f"  Responses: {n_responses}")
         print(f"  Improvement: {improvement:+.2f}")
 
-        # Extract positive quotes
-        all_quotes = extract_positive_quotes(group_df, text_cols)
-
-        # Select best 2 quotes (prefer longer, more detailed ones)
-        all_quotes.sort(key=lambda q: len(q['quote']), reverse=True)
-        selected_quotes = all_quotes[:2]
+        selected_quotes = quotes_by_trainer.get(trainer, [])
 
         # Generate case study angle based on improvement and quotes
         if improvement > 1.0:
@@ -520,8 +553,8 @@ def main():
             'trainer_name': trainer,
             'n_responses': n_responses,
             'improvement_score': round(improvement, 3),
-            'mean_early_score': round(trainer_data['mean_early'], 2),
-            'mean_late_score': round(trainer_data['mean_late'], 2),
+            'mean_early_score': round(trainer_data['early'], 2),
+            'mean_late_score': round(trainer_data['late'], 2),
             'quotes': [
                 {
                     'row_id': q['row_id'],
@@ -534,8 +567,7 @@ def main():
 
     # Save results to JSON
     output_file = Path('outputs/results.json')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    output_file.write_bytes(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
     print(f"\n{'='*60}")
     print(f"Results saved to: {output_file}")
@@ -591,25 +623,8 @@ def main():
         for i, quote in enumerate(result['quotes'], 1):
             print(f"\n  Quote {i} [{quote['row_id']}]:")
             # Word wrap for readability
-            words = quote['quote'].split()
-            lines = []
-            current_line = []
-            current_length = 0
-
-            for word in words:
-                if current_length + len(word) + 1 <= 70:
-                    current_line.append(word)
-                    current_length += len(word) + 1
-                else:
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
-                    current_length = len(word)
-
-            if current_line:
-                lines.append(' '.join(current_line))
-
-            for line in lines:
-                print(f"    {line}")
+            print(textwrap.fill(quote['quote'], width=74, initial_indent='    ', subsequent_indent='    ',
+                                break_long_words=False, break_on_hyphens=False))
 
     print(f"\n{'='*80}")
     print(f"✓ Analysis complete!")
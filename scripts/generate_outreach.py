@@ -3,19 +3,22 @@
 Generate personalized outreach emails for top improving trainers.
 """
 
-import json
+import re
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 
+import orjson
 
+
+_FIRST = re.compile(r'[._@]')
+
+
+@lru_cache(maxsize=None)
 def extract_first_name(email):
     """Extract first name from email address."""
-    # Get part before @
-    username = email.split('@')[0]
-    # Get first part before dot or underscore
-    first_part = username.split('.')[0].split('_')[0]
-    # Capitalize
-    return first_part.capitalize()
+    # Get first part before dot, underscore or @, capitalized
+    return _FIRST.split(email, 1)[0].capitalize()
 
 
 def generate_email(trainer_data):
@@ -71,8 +74,7 @@ def main():
     results_file = Path('outputs/results.json')
     print(f"Loading trainer analysis from: {results_file}\n")
 
-    with open(results_file, 'r', encoding='utf-8') as f:
-        trainers = json.load(f)
+    trainers = orjson.loads(results_file.read_bytes())
 
     print(f"Found {len(trainers)} top trainer(s)\n")
     print("="*80)
@@ -95,8 +97,7 @@ def main():
 
     # Save to JSON
     output_file = Path('outputs/outreach_ready.json')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(outreach_emails, f, indent=2, ensure_ascii=False)
+    output_file.write_bytes(orjson.dumps(outreach_emails, option=orjson.OPT_INDENT_2))
 
     print(f"\n✓ {len(outreach_emails)} outreach email(s) saved to: {output_file}")
     print(f"\nReady to send! Just personalize with your name and hit send.\n")